@@ -1,25 +1,94 @@
 # agents/itinerary_agent.py
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
-from typing import Dict, List, Optional, Tuple
+import functools
+import heapq
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 import os
 import random
-import requests
+import time
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
 
 from dotenv import load_dotenv
 load_dotenv()
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "")
 HF_TOKEN = os.getenv("HUGGINGFACE_API_KEY", "")
+HF_TIMEOUT = float(os.getenv("HF_TIMEOUT", "2.0"))  # seconds
+# Fetch the 5-day forecast alongside One Call instead of after it fails (costs an extra API call)
+WEATHER_PARALLEL_FALLBACK = os.getenv("WEATHER_PARALLEL_FALLBACK", "").lower() in ("1", "true", "yes")
+
+# Shared HTTP client so OpenWeather calls reuse pooled keep-alive connections.
+# Idle connections are kept for 5 min (httpx default: 5s) so one warmed at the
+# destination turn is still open when the plan is built a few turns later.
+_ASYNC_CLIENT = httpx.AsyncClient(
+    timeout=10,
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=300),
+    transport=httpx.AsyncHTTPTransport(retries=2),
+)
+
+async def warm_connections() -> None:
+    """
+    Open a pooled connection to OpenWeather (DNS + TLS) before the first trip is planned.
+    """
+    if not OPENWEATHER_API_KEY:
+        return
+    try:
+        await _ASYNC_CLIENT.head("https://api.openweathermap.org/", timeout=2)
+    except httpx.HTTPError:
+        pass
+
+async def close_connections() -> None:
+    await _ASYNC_CLIENT.aclose()
+
+def _consume_result(task: asyncio.Task) -> None:
+    # Retrieve a background task's exception so asyncio does not log it as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+# In-flight async lookups by key, so concurrent identical requests share one call
+_INFLIGHT: Dict[str, asyncio.Task] = {}
+
+async def _singleflight(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(factory())
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _t: _INFLIGHT.pop(key, None))
+    # Shielded so one caller being cancelled does not cancel the call for the others
+    return await asyncio.shield(task)
 
 # -------- Optional HF fun fact --------
 try:
     from huggingface_hub import InferenceClient
-    _hf_client = InferenceClient(token=HF_TOKEN) if HF_TOKEN else None
+    _hf_client = InferenceClient(token=HF_TOKEN, timeout=HF_TIMEOUT) if HF_TOKEN else None
 except Exception:
     _hf_client = None
 
+# Circuit breaker: after 3 consecutive HF failures, skip HF for 60s and go straight to the fallback
+_HF_MAX_FAILS = 3
+_HF_COOLDOWN = 60.0
+_hf_breaker = {"fails": 0, "opened_at": 0.0}
+
+def _hf_available() -> bool:
+    if not _hf_client:
+        return False
+    if _hf_breaker["fails"] < _HF_MAX_FAILS:
+        return True
+    return time.monotonic() - _hf_breaker["opened_at"] >= _HF_COOLDOWN
+
+def _hf_record(ok: bool) -> None:
+    if ok:
+        _hf_breaker["fails"] = 0
+    else:
+        _hf_breaker["fails"] += 1
+        _hf_breaker["opened_at"] = time.monotonic()
+
 # ---------- Static fallback fun facts ----------
 _FUN_FACTS: Dict[str, List[str]] = {
     "goa": [
@@ -29,138 +98,234 @@ _FUN_FACTS: Dict[str, List[str]] = {
     ],
 }
 
-def fun_fact(place: str) -> str:
-    # Try HF first
-    if _hf_client:
-        prompt = (
-            f"Give one short, accurate fun fact about {place} for travelers. "
-            f"One sentence only, no emojis."
-        )
-        try:
-            text = _hf_client.text_generation(
-                prompt,
-                max_new_tokens=50,
-                temperature=0.7,
-            )
-            if isinstance(text, str) and text.strip():
-                return text.strip()
-        except Exception:
-            pass
-    # Fallback
-    key = place.strip().lower()
+# Generated facts keyed on the normalized place; static fallbacks are not cached
+_FACT_CACHE: LRUCache = LRUCache(maxsize=512)
+
+def _hf_fun_fact(place: str) -> Optional[str]:
+    prompt = (
+        f"Give one short, accurate fun fact about {place} for travelers. "
+        f"One sentence only, no emojis."
+    )
+    text = _hf_client.text_generation(
+        prompt,
+        max_new_tokens=50,
+        temperature=0.7,
+    )
+    if isinstance(text, str) and text.strip():
+        return text.strip()
+    return None
+
+def _fallback_fact(place: str, key: str) -> str:
     if key in _FUN_FACTS:
         return random.choice(_FUN_FACTS[key])
     return f"{place.title()} has a rich culture and popular local spots worth exploring."
 
+async def fun_fact_async(place: str) -> str:
+    key = place.strip().lower()
+    if key in _FACT_CACHE:
+        return _FACT_CACHE[key]
+    return await _singleflight(f"ff:{key}", lambda: _fun_fact_fetch_async(place, key))
+
+async def _fun_fact_fetch_async(place: str, key: str) -> str:
+    if _hf_available():
+        try:
+            # InferenceClient is sync-only; keep it off the event loop and cap the wait
+            text = await asyncio.wait_for(asyncio.to_thread(_hf_fun_fact, place), timeout=HF_TIMEOUT)
+            _hf_record(True)
+        except Exception:
+            text = None
+            _hf_record(False)
+        if text:
+            _FACT_CACHE[key] = text
+            return text
+    return _fallback_fact(place, key)
+
 # ---------- OpenWeather geocoding ----------
-def geocode(place: str) -> Optional[Tuple[float, float]]:
+_GEO_URL = "https://api.openweathermap.org/geo/1.0/direct"
+_ONECALL_URL = "https://api.openweathermap.org/data/3.0/onecall"
+_FORECAST5_URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+# Coordinates rarely change; forecasts are shared for 30 min at ~1 km (2 decimal) precision
+_GEO_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=24 * 3600)
+_WX_CACHE: TTLCache = TTLCache(maxsize=2048, ttl=1800)
+
+def _wx_key(lat: float, lon: float, days: int, start_date: Optional[str]) -> tuple:
+    return round(lat, 2), round(lon, 2), days, start_date
+
+def _parse_geocode(data: Optional[list]) -> Optional[Tuple[float, float]]:
+    if not data:
+        return None
+    top = data[0]
+    return float(top["lat"]), float(top["lon"])
+
+async def geocode_async(place: str) -> Optional[Tuple[float, float]]:
     """
     Resolve (lat, lon) via OpenWeather Direct Geocoding.
     """
     if not OPENWEATHER_API_KEY:
         return None
-    url = "https://api.openweathermap.org/geo/1.0/direct"
+    key = place.strip().lower()
+    if key in _GEO_CACHE:
+        return _GEO_CACHE[key]
+    return await _singleflight(f"geo:{key}", lambda: _geocode_fetch_async(place, key))
+
+async def _geocode_fetch_async(place: str, key: str) -> Optional[Tuple[float, float]]:
     params = {"q": place, "limit": 1, "appid": OPENWEATHER_API_KEY}
-    r = requests.get(url, params=params, timeout=10)
+    r = await _ASYNC_CLIENT.get(_GEO_URL, params=params)
     if r.status_code != 200:
         return None
-    data = r.json() or []
-    if not data:
-        return None
-    top = data[0]
-    return float(top["lat"]), float(top["lon"])
+    coords = _parse_geocode(orjson.loads(r.content))
+    if coords:
+        _GEO_CACHE[key] = coords
+    return coords
 
-# ---------- OpenWeather forecasts ----------
-def _onecall_daily(lat: float, lon: float, days: int) -> Optional[List[dict]]:
+# Strong refs so fire-and-forget prefetches are not garbage-collected mid-flight
+_PREFETCHES: Set[asyncio.Task] = set()
+
+def prefetch_destination(place: str) -> None:
     """
-    Try One Call 3.0 daily forecast (up to 8 days).
+    Start geocoding `place` in the background: fills _GEO_CACHE and opens a pooled
+    OpenWeather connection while the user answers the remaining questions.
     """
-    url = "https://api.openweathermap.org/data/3.0/onecall"
-    params = {
+    if not OPENWEATHER_API_KEY:
+        return
+    task = asyncio.create_task(geocode_async(place))
+    _PREFETCHES.add(task)
+    task.add_done_callback(_PREFETCHES.discard)
+    # Errors are dropped here; plan_trip_async geocodes again on a cache miss
+    task.add_done_callback(_consume_result)
+
+# ---------- OpenWeather forecasts ----------
+def _onecall_params(lat: float, lon: float) -> dict:
+    return {
         "lat": lat,
         "lon": lon,
         "exclude": "minutely",
         "units": "metric",
         "appid": OPENWEATHER_API_KEY,
     }
-    r = requests.get(url, params=params, timeout=10)
-    if r.status_code != 200:
-        return None
-    payload = r.json() or {}
-    daily = payload.get("daily") or []
+
+def _utc_date(ts: int) -> str:
+    # 'YYYY-MM-DD' for a Unix UTC timestamp, without strftime
+    g = time.gmtime(ts)
+    return f"{g.tm_year:04d}-{g.tm_mon:02d}-{g.tm_mday:02d}"
+
+_EMPTY: dict = {}
+
+def _parse_onecall(payload: Optional[dict], days: int) -> Optional[List[dict]]:
+    daily = (payload or _EMPTY).get("daily") or []
     out = []
     for d in daily[:days]:
-        # dt is Unix UTC; temp has min/max in metric when units=metric
-        date = dt.datetime.utcfromtimestamp(d["dt"]).strftime("%Y-%m-%d")
-        t_min = d.get("temp", {}).get("min")
-        t_max = d.get("temp", {}).get("max")
-        pop = d.get("pop")  # 0..1
+        # dt is Unix UTC; temp has min/max in metric when units=metric; pop is 0..1
+        temp = d.get("temp") or _EMPTY
         out.append({
-            "date": date,
-            "t_min": t_min,
-            "t_max": t_max,
-            "precip_prob": int(round((pop or 0) * 100)),
+            "date": _utc_date(d["dt"]),
+            "t_min": temp.get("min"),
+            "t_max": temp.get("max"),
+            "precip_prob": int(round((d.get("pop") or 0) * 100)),
         })
-    return out[:days] if out else None
+    return out or None
 
-def _forecast5_aggregate(lat: float, lon: float, days: int) -> List[dict]:
+async def _onecall_daily_async(lat: float, lon: float, days: int) -> Optional[List[dict]]:
     """
-    Aggregate 5 day / 3 hour forecast into daily summaries.
+    Try One Call 3.0 daily forecast (up to 8 days).
     """
-    url = "https://api.openweathermap.org/data/2.5/forecast"
-    params = {"lat": lat, "lon": lon, "units": "metric", "appid": OPENWEATHER_API_KEY}
-    r = requests.get(url, params=params, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-    by_day: Dict[str, dict] = {}
+    r = await _ASYNC_CLIENT.get(_ONECALL_URL, params=_onecall_params(lat, lon))
+    if r.status_code != 200:
+        return None
+    return _parse_onecall(orjson.loads(r.content), days)
+
+def _forecast5_params(lat: float, lon: float) -> dict:
+    return {"lat": lat, "lon": lon, "units": "metric", "appid": OPENWEATHER_API_KEY}
+
+def _fold_min(cur: Optional[float], v: Optional[float]) -> Optional[float]:
+    return cur if v is None or (cur is not None and cur <= v) else v
+
+def _fold_max(cur: Optional[float], v: Optional[float]) -> Optional[float]:
+    return cur if v is None or (cur is not None and cur >= v) else v
+
+def _parse_forecast5(data: dict, days: int) -> List[dict]:
+    # Per day: [min temp_min, max temp_max, min temp, max temp, max pop],
+    # folded in a single pass instead of collecting per-day sample lists
+    by_day: Dict[str, list] = {}
     for item in data.get("list", []):
         dt_txt = item.get("dt_txt")  # 'YYYY-MM-DD HH:MM:SS'
         if not dt_txt:
             continue
-        day_key = dt_txt.split(" ")[0]
+        day_key = dt_txt[:10]
         main = item.get("main", {})
         t = main.get("temp")
-        t_min = main.get("temp_min")
-        t_max = main.get("temp_max")
         pop = item.get("pop", 0)  # 0..1
-        b = by_day.setdefault(day_key, {"temps": [], "mins": [], "maxs": [], "pops": []})
-        if t is not None: b["temps"].append(t)
-        if t_min is not None: b["mins"].append(t_min)
-        if t_max is not None: b["maxs"].append(t_max)
-        b["pops"].append(pop)
+        b = by_day.get(day_key)
+        if b is None:
+            b = by_day[day_key] = [None, None, None, None, pop]
+        elif pop > b[4]:
+            b[4] = pop
+        b[0] = _fold_min(b[0], main.get("temp_min"))
+        b[1] = _fold_max(b[1], main.get("temp_max"))
+        b[2] = _fold_min(b[2], t)
+        b[3] = _fold_max(b[3], t)
     out = []
-    for day in sorted(by_day.keys())[:days]:
-        b = by_day[day]
-        tmin = min(b["mins"]) if b["mins"] else (min(b["temps"]) if b["temps"] else None)
-        tmax = max(b["maxs"]) if b["maxs"] else (max(b["temps"]) if b["temps"] else None)
-        pop_pct = int(round(max(b["pops"]) * 100)) if b["pops"] else 0
-        out.append({"date": day, "t_min": tmin, "t_max": tmax, "precip_prob": pop_pct})
-    return out[:days]
+    for day in heapq.nsmallest(days, by_day):
+        mn, mx, t_lo, t_hi, pop = by_day[day]
+        tmin = mn if mn is not None else t_lo
+        tmax = mx if mx is not None else t_hi
+        out.append({"date": day, "t_min": tmin, "t_max": tmax, "precip_prob": int(round(pop * 100))})
+    return out
+
+async def _forecast5_aggregate_async(lat: float, lon: float, days: int) -> List[dict]:
+    """
+    Aggregate 5 day / 3 hour forecast into daily summaries.
+    """
+    r = await _ASYNC_CLIENT.get(_FORECAST5_URL, params=_forecast5_params(lat, lon))
+    r.raise_for_status()
+    return _parse_forecast5(orjson.loads(r.content), days)
 
-def daily_weather(lat: float, lon: float, days: int, start_date: Optional[str] = None) -> List[dict]:
-    ...
+def _from_start_date(forecast: List[dict], days: int, start_date: Optional[str]) -> List[dict]:
+    if not start_date:
+        return forecast
+    sd = dt.date.fromisoformat(start_date)
+    idx = next((i for i, d in enumerate(forecast) if dt.date.fromisoformat(d["date"]) >= sd), 0)
+    return forecast[idx: idx + days]
+
+async def _onecall_or_forecast5_async(lat: float, lon: float, days: int) -> List[dict]:
+    """
+    Start the 5-day request up front and drop it if One Call answers.
+    """
+    f5_task = asyncio.create_task(_forecast5_aggregate_async(lat, lon, days))
+    # A failure only matters if we end up awaiting the task
+    f5_task.add_done_callback(_consume_result)
+    try:
+        oc = await _onecall_daily_async(lat, lon, days)
+    except BaseException:
+        f5_task.cancel()
+        raise
+    if oc:
+        f5_task.cancel()
+        return oc
+    return await f5_task
 
+async def daily_weather_async(lat: float, lon: float, days: int, start_date: Optional[str] = None) -> List[dict]:
     """
     Prefer One Call 3.0 daily; fall back to 5-day/3-hour aggregation.
     """
     if not OPENWEATHER_API_KEY:
         return []
-    oc = _onecall_daily(lat, lon, days)
-    if oc:
-        if start_date:
-            sd = dt.date.fromisoformat(start_date)
-            idx = next((i for i, d in enumerate(oc) if dt.date.fromisoformat(d["date"]) >= sd), 0)
-            return oc[idx: idx + days]
-        else:
-            return oc
-    forecast5 = _forecast5_aggregate(lat, lon, days)
-    if start_date:
-        sd = dt.date.fromisoformat(start_date)
-        idx = next((i for i, d in enumerate(forecast5) if dt.date.fromisoformat(d["date"]) >= sd), 0)
-        return forecast5[idx: idx + days]
+    key = _wx_key(lat, lon, days, start_date)
+    if key in _WX_CACHE:
+        return _WX_CACHE[key]
+    return await _singleflight(f"wx:{key}", lambda: _daily_weather_fetch_async(lat, lon, days, start_date, key))
+
+async def _daily_weather_fetch_async(lat: float, lon: float, days: int, start_date: Optional[str], key: tuple) -> List[dict]:
+    if WEATHER_PARALLEL_FALLBACK:
+        forecast = await _onecall_or_forecast5_async(lat, lon, days)
     else:
-        return forecast5
-    #return _forecast5_aggregate(lat, lon, days)
+        oc = await _onecall_daily_async(lat, lon, days)
+        forecast = oc if oc else await _forecast5_aggregate_async(lat, lon, days)
+    result = _from_start_date(forecast, days, start_date)
+    if result:
+        _WX_CACHE[key] = result
+    return result
 
 # ---------- Itinerary generator ----------
 _ACTIVITY_MAP = {
@@ -173,17 +338,19 @@ _ACTIVITY_MAP = {
     "famous places": ["top landmarks circuit", "iconic photo spots", "must-see square/fort"],
 }
 
+_DEFAULT_POOL = ("city highlights tour", "local food tasting", "market visit", "sunset viewpoint")
+
+@functools.lru_cache(maxsize=128)
+def _pool_for(prefs: Tuple[str, ...]) -> Tuple[str, ...]:
+    pool = tuple(itertools.chain.from_iterable(_ACTIVITY_MAP.get(p, ()) for p in prefs))
+    return pool or _DEFAULT_POOL
+
 def build_itinerary(destination: str, days: int, people: int, preferences: List[str], weather: List[dict]) -> List[str]:
-    prefs = [p.lower() for p in preferences]
-    pool: List[str] = []
-    for p in prefs:
-        pool.extend(_ACTIVITY_MAP.get(p, []))
-    if not pool:
-        pool = ["city highlights tour", "local food tasting", "market visit", "sunset viewpoint"]
+    # Callers (server.py, travel_node) pass preferences already stripped and lowercased
+    pool = _pool_for(tuple(preferences))
 
     plan = []
-    for i in range(days):
-        slot = pool[i % len(pool)]
+    for i, slot in enumerate(itertools.islice(itertools.cycle(pool), days)):
         w = weather[i] if i < len(weather) else None
         if w and w.get("t_min") is not None and w.get("t_max") is not None:
             avg = int(round((w["t_min"] + w["t_max"]) / 2))
@@ -195,15 +362,37 @@ def build_itinerary(destination: str, days: int, people: int, preferences: List[
         plan[-1] += f" Departure planning for {people} traveler(s)."
     return plan
 
-def plan_trip(destination: str, days: int, people: int, preferences: List[str], start_date: Optional[str] = None) -> Tuple[str, List[str]]:
-    fact = fun_fact(destination)
-    coords = geocode(destination)
+# Streaming hook: await emit(event, text) as parts of the plan become available
+Emit = Callable[[str, str], Awaitable[None]]
+
+def _opening_line(destination: str, fact: str) -> str:
+    return f"Wow, {destination.title()} is a nice place — fun fact: {fact}"
+
+async def _opening_async(destination: str, emit: Optional[Emit]) -> str:
+    opening = _opening_line(destination, await fun_fact_async(destination))
+    if emit:
+        await emit("fact", opening)
+    return opening
+
+async def plan_trip_async(destination: str, days: int, people: int, preferences: List[str], start_date: Optional[str] = None, emit: Optional[Emit] = None) -> Tuple[str, List[str]]:
+    """
+    The fun fact is fetched concurrently with the geocode -> weather chain,
+    so a trip costs max(fact, weather) rather than their sum. With `emit`, the opening line is streamed as
+    soon as the fact arrives, followed by one "day" event per itinerary line.
+    """
+    opening_task = asyncio.create_task(_opening_async(destination, emit))
     weather_list: List[dict] = []
-    if coords:
-        lat, lon = coords
-        weather_list = daily_weather(lat, lon, days, start_date)  # pass start_date here
+    try:
+        coords = await geocode_async(destination)
+        if coords:
+            lat, lon = coords
+            weather_list = await daily_weather_async(lat, lon, days, start_date)
+    except BaseException:
+        opening_task.cancel()
+        raise
+    opening = await opening_task
     itinerary = build_itinerary(destination, days, people, preferences, weather_list)
-    opening = f"Wow, {destination.title()} is a nice place — fun fact: {fact}"
+    if emit:
+        for line in itinerary:
+            await emit("day", line)
     return opening, itinerary
-
-
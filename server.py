@@ -1,19 +1,57 @@
 # server.py : uvicorn server:app --reload --port 8000
 from __future__ import annotations
 
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import orjson
+from cachetools import TTLCache
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any
 
+from agents.itinerary_agent import close_connections, warm_connections
 from graph.travel_graph import build_graph
 
-app = FastAPI()
+log = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Refuse to start against an unreachable Redis rather than erroring on every /chat
+    if _redis is not None:
+        await _redis.ping()
+    await warm_connections()
+    try:
+        yield
+    finally:
+        await close_connections()
+        if _redis is not None:
+            await _redis.aclose()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# In-memory sessions for demo purposes
-_SESSIONS: Dict[str, Dict[str, Any]] = {}
+# Served from memory; restart the server to pick up edits
+with open("static/index.html", "rb") as f:
+    _INDEX_HTML = f.read()
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+# -------- Optional Redis session store (shared across uvicorn workers) --------
+# Optional only when REDIS_URL is unset. Once it is set, a missing package or a bad
+# URL fails here instead of silently splitting sessions across per-worker memory.
+_redis = None
+if REDIS_URL:
+    import redis.asyncio as aioredis
+    _redis = aioredis.from_url(REDIS_URL)
+
+# In-memory fallback for single-process demos; bounded and expiring like the Redis keys
+_SESSIONS: TTLCache = TTLCache(maxsize=10_000, ttl=SESSION_TTL)
 
 graph = build_graph()
 
@@ -22,15 +60,8 @@ class ChatIn(BaseModel):
     message: str = ""
     preferences: list[str] | None = None
 
-@app.get("/")
-async def index():
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
-
-@app.post("/chat")
-async def chat(body: ChatIn):
-    sid = body.session_id
-    session = _SESSIONS.setdefault(sid, {
+def _new_session() -> Dict[str, Any]:
+    return {
         "messages": [],
         "name": None,
         "destination": None,
@@ -40,7 +71,32 @@ async def chat(body: ChatIn):
         "itinerary": [],
         "ui": {},
         "input_text": "",
-    })
+    }
+
+def _msg_enc(obj: Any) -> Dict[str, Any]:
+    # LangChain messages -> the same {"type", "content"} dicts the client appends
+    if hasattr(obj, "type") and hasattr(obj, "content"):
+        return {"type": obj.type, "content": obj.content}
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+async def _load_session(sid: str) -> Dict[str, Any]:
+    if _redis is not None:
+        raw = await _redis.get(f"sess:{sid}")
+        return orjson.loads(raw) if raw else _new_session()
+    return _SESSIONS.get(sid) or _new_session()
+
+async def _save_session(sid: str, state: Dict[str, Any]) -> None:
+    if _redis is not None:
+        await _redis.setex(f"sess:{sid}", SESSION_TTL, orjson.dumps(state, default=_msg_enc))
+    else:
+        _SESSIONS[sid] = state
+
+@app.get("/")
+async def index():
+    return HTMLResponse(_INDEX_HTML)
+
+async def _begin_turn(body: ChatIn) -> Dict[str, Any]:
+    session = await _load_session(body.session_id)
 
     # Merge UI selections into state if provided
     if body.preferences:
@@ -49,13 +105,9 @@ async def chat(body: ChatIn):
     # Provide the latest user text
     session["messages"].append({"type": "human", "content": body.message})
     session["input_text"] = body.message or ""
+    return session
 
-    # Invoke the graph
-    result = graph.invoke(session)
-
-    # Persist new state
-    _SESSIONS[sid] = result
-
+def _reply(result: Dict[str, Any]) -> Dict[str, Any]:
     # Find the latest AI message
     ai_text = ""
     for m in reversed(result.get("messages", [])):
@@ -64,4 +116,54 @@ async def chat(body: ChatIn):
             break
 
     ui = result.get("ui", {}) or {}
-    return JSONResponse({"reply": ai_text, "ui": ui})
+    return {"reply": ai_text, "ui": ui}
+
+@app.post("/chat")
+async def chat(body: ChatIn):
+    session = await _begin_turn(body)
+
+    # Invoke the graph
+    result = await graph.ainvoke(session)
+
+    # Persist new state
+    await _save_session(body.session_id, result)
+
+    return ORJSONResponse(_reply(result))
+
+@app.post("/chat/stream")
+async def chat_stream(body: ChatIn):
+    """
+    Server-Sent Events variant of /chat: "status", "fact" and "day" events carry
+    {"text": ...} as the plan is built, then "done" carries the /chat payload,
+    or "error" carries {"message": ...} if the turn failed.
+    """
+    session = await _begin_turn(body)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, text: str) -> None:
+        await queue.put((event, {"text": text}))
+
+    async def run() -> None:
+        try:
+            result = await graph.ainvoke(session, config={"configurable": {"emit": emit}})
+            await _save_session(body.session_id, result)
+            await queue.put(("done", _reply(result)))
+        except Exception:
+            # Headers are already sent, so report the failure in-band
+            log.exception("chat stream failed for session %s", body.session_id)
+            await queue.put(("error", {"message": "Sorry, something went wrong. Please try again."}))
+        finally:
+            await queue.put(None)
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while (item := await queue.get()) is not None:
+                event, data = item
+                yield b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+        finally:
+            task.cancel()
+
+    # Keep proxies (nginx et al.) from buffering the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
@@ -7,8 +7,9 @@ from typing import Annotated, List, Optional, TypedDict
 
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
 
-from agents.itinerary_agent import plan_trip
+from agents.itinerary_agent import plan_trip_async, prefetch_destination
 
 # Helpers
 _NUM_RE = re.compile(r"(\d+)")
@@ -33,8 +34,7 @@ class TravelState(TypedDict, total=False):
     itinerary: List[str]
 
 
-def travel_node(state: TravelState) -> TravelState:
-    messages = state.get("messages", [])
+async def travel_node(state: TravelState, config: RunnableConfig) -> TravelState:
     user_text = (state.get("input_text") or "").strip()
 
     name = state.get("name")
@@ -49,17 +49,18 @@ def travel_node(state: TravelState) -> TravelState:
         if user_text:
             name = user_text.title()
             ai = AIMessage(content=f"Hi {name}, where are you planning to go on a trip?")
-            return {"messages": messages + [ai], "name": name}
-        return {"messages": messages + [AIMessage(content="Hi, please state your name.")]}
+            return {"messages": [ai], "name": name}
+        return {"messages": [AIMessage(content="Hi, please state your name.")]}
 
     # 2) Destination
     if not dest:
         if user_text:
             dest = user_text.strip().title()
+            prefetch_destination(dest)
             opening = f"Wow, {dest} is a nice place."
             ai = AIMessage(content=f"{opening} How many days and people are going on the trip?")
-            return {"messages": messages + [ai], "destination": dest}
-        return {"messages": messages + [AIMessage(content="Please tell the destination city or place.")]}
+            return {"messages": [ai], "destination": dest}
+        return {"messages": [AIMessage(content="Please tell the destination city or place.")]}
 
     # 3) Days & People
     if not days or not people:
@@ -74,10 +75,10 @@ def travel_node(state: TravelState) -> TravelState:
 
         if not days or not people:
             ai = AIMessage(content="Please specify trip length and group size, e.g., '5 days and 2 people'.")
-            return {"messages": messages + [ai]}
+            return {"messages": [ai]}
 
         ai = AIMessage(content="Great. What is the trip start date? Please provide in YYYY-MM-DD format.")
-        return {"messages": messages + [ai], "days": days, "people": people}
+        return {"messages": [ai], "days": days, "people": people}
 
     # 4) Start Date
     if not start_date:
@@ -92,9 +93,9 @@ def travel_node(state: TravelState) -> TravelState:
                 ],
             }
             ai = AIMessage(content="One last thing—select preferences from the checkboxes, then send.")
-            return {"messages": messages + [ai], "start_date": start_date, "ui": ui_hint}
+            return {"messages": [ai], "start_date": start_date, "ui": ui_hint}
         ai = AIMessage(content="Please provide the trip start date in YYYY-MM-DD format.")
-        return {"messages": messages + [ai]}
+        return {"messages": [ai]}
 
     # 5) Preferences
     if not prefs:
@@ -108,13 +109,17 @@ def travel_node(state: TravelState) -> TravelState:
                 ],
             }
             ai = AIMessage(content="Please select your preferences using the checkboxes.")
-            return {"messages": messages + [ai], "ui": ui_hint}
+            return {"messages": [ai], "ui": ui_hint}
         prefs = chosen
 
-    # 6) Plan itinerary
-    opening, itinerary = plan_trip(dest, days, people, prefs, start_date)
-    ai = AIMessage(content="\n".join(["That's great—planning your itinerary now.", opening] + itinerary))
-    return {"messages": messages + [ai], "preferences": prefs, "itinerary": itinerary, "ui": {}}
+    # 6) Plan itinerary (streamed when the caller passes an `emit` hook in config)
+    status = "That's great—planning your itinerary now."
+    emit = (config or {}).get("configurable", {}).get("emit")
+    if emit:
+        await emit("status", status)
+    opening, itinerary = await plan_trip_async(dest, days, people, prefs, start_date, emit=emit)
+    ai = AIMessage(content="\n".join([status, opening] + itinerary))
+    return {"messages": [ai], "preferences": prefs, "itinerary": itinerary, "ui": {}}
 
 
 # Build graph